@@ -1,11 +1,10 @@
 #! /usr/bin/env python
 
 import time
-import random
-import math
-import copy
-import itertools
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
 
 import tsp
 
@@ -51,21 +50,10 @@ DEFAULT_FITNESS = float("inf")
 VERBOSE = False
 
 
-def map_genome(genome):
-    """
-    Map a genome to a phenotype (input to output) with identity.
-
-    :param genome: List of node(city) to visit in order
-    :type genome: list of integers
-    :return: List of node(city) to visit in order
-    :rtype: list of integers
-    """
-    return genome
-
-
 def evolutionary_algorithm(population_size, generations,
                            mutation_probability, crossover_probability,
-                           tournament_size, elite_size, tsp_data):
+                           tournament_size, elite_size, tsp_data, rng,
+                           workers=1):
     """
   The evolutionary algorithm (EA), performs a *stochastic parallel
   iterative* search. The algorithm:
@@ -85,11 +73,11 @@ def evolutionary_algorithm(population_size, generations,
 
   The data fields are:
 
-  - Individual, a dictionary:
+  - Population, two arrays where row `i` is the `i`-th solution:
 
-    - Genome, an integer list
-    - Fitness, an integer for the fitness value
-    - Phenotype, a representation of a TSP tour
+    - Genomes, an integer array of shape (population size, number of cities).
+      A genome is the TSP tour itself, there is no separate phenotype
+    - Fitness, a float array with the fitness value of each genome
 
 
     :param population_size:
@@ -99,224 +87,412 @@ def evolutionary_algorithm(population_size, generations,
     :param tournament_size:
     :param elite_size:
     :param tsp_data:
-    :return:
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :param workers: Number of threads evaluating the fitness
+    :return: Best genome and its fitness
+    :rtype: tuple
     """
     ##########
     # Create TSP problem
     ##########
-    # Parse the TSP data to a cost matrix
-    cost_matrix = tsp.parse_city_data(tsp_data)
+    # Parse the TSP data to a contiguous cost matrix. Single precision is
+    # enough for summing the edge costs and halves the memory traffic
+    cost_matrix = np.ascontiguousarray(tsp.parse_city_data(tsp_data),
+                                       dtype=np.float32)
     number_of_cities = len(cost_matrix)
-    # Base tour is shuffled for each solution in the population
-    base_tour = list(range(0, number_of_cities))
 
     ##########
     # Initial population
     ##########
-    population = []
-    for i in range(population_size):
-        genome = base_tour[:]
-        random.shuffle(genome)
-        solution = {'genome': genome,
-                      'fitness': DEFAULT_FITNESS,
-                      'phenotype': map_genome(genome)}
-        population.append(solution)
-        if VERBOSE:
-            print('Initial {}: {}'.format(solution['genome'], solution['fitness']))
+    # Each row is a random permutation of the cities. The smallest integer
+    # type that holds the cities keeps more genomes in the cache
+    base_tour = np.arange(number_of_cities,
+                          dtype=np.min_scalar_type(-number_of_cities))
+    genomes = rng.permuted(np.tile(base_tour, (population_size, 1)), axis=1)
+    fitness = np.full(population_size, DEFAULT_FITNESS)
+    if VERBOSE:
+        for genome in genomes:
+            print('Initial {}: {}'.format(genome.tolist(), DEFAULT_FITNESS))
 
     ##########
     # Evaluate fitness
     ##########
-    for solution in population:
-        solution['fitness'] = tsp.get_tour_cost(solution['phenotype'], cost_matrix)
-
-    ##########
-    # Generation loop
-    ##########
-    generation = 0
-    while generation < generations:
+    # The fitness evaluation is spread over a thread pool with more than
+    # one worker
+    executor = ThreadPoolExecutor(workers) if workers > 1 else None
+    try:
+        # The number of cities is fixed for the run
+        tour_cost = tsp.make_batch_tour_cost(cost_matrix, executor)
+        fitness[:] = tour_cost(genomes)
 
         ##########
-        # Select fit solutions
+        # Generation loop
         ##########
-        new_population = []
-        while len(new_population) < population_size:
-            # Randomly select tournament size solutions
-            # from the population.
-            competitors = random.sample(population, tournament_size)
-            # Rank the selected solutions in a competition
-            sort_population(competitors)
-            # Append the winner of the competition to the new population
-            new_population.append(copy.deepcopy(competitors[0]))
+        generation = 0
+        while generation < generations:
+            genomes, fitness = ea_step(genomes, fitness, cost_matrix,
+                                       crossover_probability,
+                                       mutation_probability, tournament_size,
+                                       elite_size, rng, tour_cost)
 
-        ##########
-        # Vary the population by crossover
-        ##########
-        for i, solution in enumerate(new_population):
-            if crossover_probability > random.random():
-                # Select a mate for crossover
-                mate = random.sample(new_population, 1)
-                # Put the child in the population
-                new_population[i] = modified_onepoint_crossover(solution, *mate)
+            # Print the stats of the population
+            print_stats(generation, genomes, fitness)
 
-        ##########
-        # Vary the population by mutation
-        ##########
-        for i, solution in enumerate(new_population):
-            if mutation_probability > random.random():
-                # Mutate genes by swapping them
-                new_population[i] = swap_mutation(solution)
+            # Increase the generation counter
+            generation += 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
 
-        ##########
-        # Evaluate fitness
-        ##########
-        for solution in new_population:
-            solution['fitness'] = tsp.get_tour_cost(solution['phenotype'], cost_matrix)
+    return genomes[0], fitness[0]
 
-        ##########
-        # Replace population
-        ##########
-        sort_population(population)
-        # Add best(elite) solutions from old population
-        population = population[:elite_size] + new_population
-        sort_population(population)
-        # Trim back to population size
-        population = population[:population_size]
 
-        # Print the stats of the population
-        print_stats(generation, population)
+def ea_step(genomes, fitness, cost_matrix, crossover_probability,
+            mutation_probability, tournament_size, elite_size, rng,
+            tour_cost):
+    """
+    One generation of the evolutionary algorithm. Select, vary,
+    evaluate and replace the population.
+
+    :param genomes: Genomes of the population
+    :type genomes: numpy.ndarray
+    :param fitness: Fitness of the genomes
+    :type fitness: numpy.ndarray
+    :param cost_matrix: Cost of path between cities
+    :type cost_matrix: numpy.ndarray
+    :param crossover_probability:
+    :param mutation_probability:
+    :param tournament_size:
+    :param elite_size:
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :param tour_cost: Function returning the cost of each genome, from
+      `tsp.make_batch_tour_cost`
+    :type tour_cost: function
+    :return: Genomes and fitness of the next population, best first
+    :rtype: tuple
+    """
+    population_size = len(genomes)
+
+    ##########
+    # Select fit solutions
+    ##########
+    # Randomly select tournament size solutions from the population,
+    # one tournament per row
+    competitors = rng.integers(0, population_size,
+                               (population_size, tournament_size))
+    # The winner of each competition has the lowest cost
+    winners = competitors[np.arange(population_size),
+                          np.argmin(fitness[competitors], axis=1)]
+    # Copy the winners to the new population
+    new_genomes = genomes[winners]
+    new_fitness = fitness[winners]
 
-        # Increase the generation counter
-        generation += 1
+    ##########
+    # Vary the population by crossover
+    ##########
+    # Pick the solutions to cross over
+    crossed = np.flatnonzero(rng.random(population_size) < crossover_probability)
+    # Select a mate for each crossover
+    mates = rng.integers(0, population_size, crossed.size)
+    # Put the children in the population
+    new_genomes[crossed] = modified_onepoint_crossover(new_genomes[crossed],
+                                                       new_genomes[mates], rng)
+    new_fitness[crossed] = DEFAULT_FITNESS
 
-    return population[0]
+    ##########
+    # Vary the population by mutation
+    ##########
+    swap_mutation(new_genomes, new_fitness, mutation_probability, cost_matrix,
+                  rng)
 
+    ##########
+    # Evaluate fitness
+    ##########
+    # Selected solutions keep their fitness and mutation updates it, only
+    # the children from crossover are unevaluated
+    unevaluated = new_fitness == DEFAULT_FITNESS
+    new_fitness[unevaluated] = tour_cost(new_genomes[unevaluated])
 
-def sort_population(population):
-    """
-    Sort population by fitness.
+    ##########
+    # Replace population
+    ##########
+    # Add best(elite) solutions from old population
+    elites = get_best_indices(fitness, elite_size)
+    genomes = np.concatenate((genomes[elites], new_genomes))
+    fitness = np.concatenate((fitness[elites], new_fitness))
+    # Trim back to population size
+    survivors = get_best_indices(fitness, population_size)
+    return sort_population(genomes[survivors], fitness[survivors])
 
-    Decreasing fitness order.
 
-    :param population:
-    :return: sorted population
+def get_best_indices(fitness, k):
+    """
+    Indices of the `k` solutions with the lowest cost, in no particular
+    order. A partial sort is enough to find them.
+
+    :param fitness: Fitness of the population
+    :type fitness: numpy.ndarray
+    :param k: Number of solutions
+    :type k: int
+    :return: Indices of the best solutions
+    :rtype: numpy.ndarray
     """
-    population.sort(reverse=False, key=lambda x: x['fitness'])
+    if k >= len(fitness):
+        return np.arange(len(fitness))
 
+    return np.argpartition(fitness, k)[:k]
 
-def modified_onepoint_crossover(parent_one, parent_two):
-    """Given two individuals, create one child using one-point
-    crossover and return.
 
-    A cut position is chosen at random on the first parent
-    chromosome. Then, an offspring is created by appending the second
-    parent chromosome to the initial segment of the first parent
-    (before the cut point), and by eliminating the duplicates.
+def sort_population(genomes, fitness):
+    """
+    Sort population by fitness.
 
-    :param parent_one: A parent
-    :type parent_one: dict
-    :param parent_two: Another parent
-    :type parent_two: dict
-    :return: A child
-    :rtype: dict
+    Increasing cost order, i.e. the best solution first. A stable sort
+    keeps the order of solutions with equal fitness.
 
+    :param genomes: Genomes of the population
+    :type genomes: numpy.ndarray
+    :param fitness: Fitness of the genomes
+    :type fitness: numpy.ndarray
+    :return: sorted genomes and fitness
+    :rtype: tuple
     """
-    child = {'genome': [], 'fitness': DEFAULT_FITNESS, 'phenotype': None}
+    order = np.argsort(fitness, kind='stable')
+    return genomes[order], fitness[order]
 
-    # Pick a point for crossover
-    point = random.randint(0, len(parent_one['genome']))
-    # Get temporary genome concatenate
-    _genome = parent_one['genome'][:point] + parent_two['genome'][:]
-    # Remove duplicate genes
-    for gene in _genome:
-        if gene not in child['genome']:
-            # Append the first gene to child genome
-            child['genome'].append(gene)
 
-    child['phenotype'] = map_genome(child['genome'])
+def modified_onepoint_crossover(parents_one, parents_two, rng):
+    """Given two batches of genomes, create one child per pair of
+    parents using one-point crossover and return the children.
 
-    return child
+    A cut position is chosen at random on the first parent
+    chromosome. Then, an offspring is created by appending the second
+    parent chromosome to the initial segment of the first parent
+    (before the cut point), and by eliminating the duplicates.
 
+    All pairs are crossed over at once. Each child keeps exactly one
+    gene per city, so the kept genes of all pairs form a full array.
 
-def swap_mutation(solution):
-    """Mutate the solution by random swap.
+    :param parents_one: Parent genomes, one per row
+    :type parents_one: numpy.ndarray
+    :param parents_two: Other parent genomes, one per row
+    :type parents_two: numpy.ndarray
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :return: Child genomes, one per row
+    :rtype: numpy.ndarray
 
-    :param solution:
-    :type solution: dict
-    :return: Mutated solution
-    :rtype: dict
+    """
+    number_of_children, genome_length = parents_one.shape
+    # Pick a point for each crossover
+    points = rng.integers(0, genome_length + 1, number_of_children)
+    # Genes of the initial segment of the first parent
+    head = np.arange(genome_length) < points[:, np.newaxis]
+    # Mark the genes of the initial segment as seen. The genome is a
+    # permutation, so every city is written exactly once
+    seen = np.empty(parents_one.shape, dtype=np.bool_)
+    np.put_along_axis(seen, parents_one, head, axis=1)
+    # Remove duplicate genes by keeping the unseen genes of the second
+    # parent in order
+    tail = ~np.take_along_axis(seen, parents_two, axis=1)
+    genes = np.concatenate((parents_one, parents_two), axis=1)
+    keep = np.concatenate((head, tail), axis=1)
+    return genes[keep].reshape(parents_one.shape)
+
+
+def swap_mutation(genomes, fitness, mutation_probability, cost_matrix, rng):
+    """Mutate solutions of the population in place by random swap.
+
+    Each solution is mutated with the mutation probability. A swap only
+    changes the (at most four) edges next to the swapped cities, so the
+    fitness of a mutated solution is updated by the cost difference of
+    those edges instead of evaluating the whole tour. Unevaluated
+    fitness stays unevaluated.
+
+    :param genomes: Genomes of the population
+    :type genomes: numpy.ndarray
+    :param fitness: Fitness of the genomes
+    :type fitness: numpy.ndarray
+    :param mutation_probability: Probability of mutating a solution
+    :type mutation_probability: float
+    :param cost_matrix: Cost of path between cities
+    :type cost_matrix: numpy.ndarray
+    :param rng: Random number generator
+    :type rng: numpy.random.Generator
+    :return: Indices of the mutated solutions
+    :rtype: numpy.ndarray
 
     """
 
+    # Pick the solutions to mutate
+    population_size, genome_length = genomes.shape
+    rows = np.flatnonzero(rng.random(population_size) < mutation_probability)
     # Pick points for swapping
-    genome_length = len(solution['genome']) - 1
-    point_one = random.randint(0, genome_length)
-    point_two = random.randint(0, genome_length)
-    # Temporary store the values
-    value_one = solution['genome'][point_one]
-    value_two = solution['genome'][point_two]
-    # Swap the values
-    solution['genome'][point_one] = value_two
-    solution['genome'][point_two] = value_one
-    # Reset fitness
-    solution['fitness'] = DEFAULT_FITNESS
-    solution['phenotype'] = map_genome(solution['genome'])
-
-    return solution
-
-
-def print_stats(generation, population):
+    point_one = rng.integers(0, genome_length, rows.size)
+    point_two = rng.integers(0, genome_length, rows.size)
+    # Edge k goes from position k to the next position. The edges into
+    # and out of the swapped positions change, sorted to find duplicates
+    edges = np.sort(np.stack((point_one - 1, point_one,
+                              point_two - 1, point_two), axis=1)
+                    % genome_length, axis=1)
+    # Count each changed edge once, e.g. when swapping neighbours
+    counted = np.ones(edges.shape, dtype=np.bool_)
+    counted[:, 1:] = edges[:, 1:] != edges[:, :-1]
+    cost_before = get_edge_costs(genomes, rows, edges, counted, cost_matrix)
+    # Swap the values, the right hand side is copied before assignment
+    genomes[rows, point_one], genomes[rows, point_two] = \
+        genomes[rows, point_two], genomes[rows, point_one]
+    cost_after = get_edge_costs(genomes, rows, edges, counted, cost_matrix)
+    # Update fitness
+    fitness[rows] += cost_after - cost_before
+
+    return rows
+
+
+def get_edge_costs(genomes, rows, edges, counted, cost_matrix):
+    """
+    Summed cost of the counted edges in each of the given rows.
+
+    :param genomes: Genomes of the population
+    :type genomes: numpy.ndarray
+    :param rows: Indices of the genomes
+    :type rows: numpy.ndarray
+    :param edges: Edge positions for each row, edge k goes from position k
+      to position k + 1
+    :type edges: numpy.ndarray
+    :param counted: True if the edge is part of the sum
+    :type counted: numpy.ndarray
+    :param cost_matrix: Cost of path between cities
+    :type cost_matrix: numpy.ndarray
+    :return: Cost of the edges of each row
+    :rtype: numpy.ndarray
+    """
+    _rows = rows[:, np.newaxis]
+    _from = genomes[_rows, edges]
+    _to = genomes[_rows, (edges + 1) % genomes.shape[1]]
+    return np.where(counted, cost_matrix[_from, _to], 0).sum(axis=1)
+
+
+def print_stats(generation, genomes, fitness):
     """
     Print the statistics for the generation and population.
 
     :param generation:generation number
     :type generation: integer
-    :param population: population to get statistics for
-    :type population: list of population
+    :param genomes: genomes of the population, best first
+    :type genomes: numpy.ndarray
+    :param fitness: fitness of the population, best first
+    :type fitness: numpy.ndarray
     """
 
-    def get_ave_and_std(values):
-        """
-        Return average and standard deviation.            
-
-        :param values: Values to calculate on
-        :type values: list
-        :returns: Average and Standard deviation of the input values
-        :rtype: Tuple of floats
-        """
-        _ave = float(sum(values)) / len(values)
-        _std = math.sqrt(float(
-            sum((value - _ave) ** 2 for value in values)) / len(values))
-        return _ave, _std
-
-    # Get the fitness values
-    fitness_values = [i['fitness'] for i in population]
     # Calculate average and standard deviation of the fitness in
     # the population
-    ave_fit, std_fit = get_ave_and_std(fitness_values)
-    # Print the statistics, including the best solution
-    print("Gen:{}; Population fitness mean:{:.2f}+-{:.3f}; Best solution:{}, fitness:{}".format(
-        generation, ave_fit, std_fit, population[0]['genome'], population[0]['fitness']))
+    ave_fit, std_fit = fitness.mean(), fitness.std()
+    # Print the statistics, the best solution can be a long list so it
+    # is only printed in verbose mode
+    print("Gen:{}; Population fitness mean:{:.2f}+-{:.3f}; Best fitness:{}".format(
+        generation, ave_fit, std_fit, fitness[0]))
+    if VERBOSE:
+        print("Best solution:{}".format(genomes[0].tolist()))
 
 
-def tsp_exhaustive_search(tsp_data):
+def tsp_exhaustive_search(tsp_data, workers=1):
     """
     Brute force search
+
+    A tour is a cycle, so rotating it does not change the cost. The first
+    city is fixed and the permutations of the other cities are searched.
+
+    With more than one worker the second city is fixed as well, and the
+    tours for each second city are searched in a separate process.
+
     :param tsp_data: cost matrix
+    :param workers: Number of processes searching
+    :type workers: int
     """
     city_data = tsp.parse_city_data(tsp_data)
-    base_tour = range(0, len(city_data))
-    min_tour = {'cost': float("inf"), 'tour': None}
     start_time = time.time()
-    for tour in itertools.permutations(base_tour):
-        cost = tsp.get_tour_cost(list(tour), city_data)
-        if cost < min_tour['cost']:
-            min_tour['cost'] = cost
-            min_tour['tour'] = tour
-
+    if workers > 1 and len(city_data) > 2:
+        prefixes = [[0, city] for city in range(1, len(city_data))]
+        with ProcessPoolExecutor(workers) as executor:
+            results = list(executor.map(search_permutations,
+                                        [city_data] * len(prefixes), prefixes))
+        min_cost, min_tour, _ = min(results, key=lambda x: x[0])
+        searched = sum(result[2] for result in results)
+    else:
+        min_cost, min_tour, searched = search_permutations(city_data, [0])
     execution_time = time.time() - start_time
     print("EXHAUSTIVE:\n A minimal tour cost is {} for path {}. Searched {} points in {:.5f} seconds".format(
-        min_tour['cost'], min_tour['tour'], math.factorial(len(city_data)), execution_time))
+        min_cost, tuple(min_tour), searched, execution_time))
+
+
+def search_permutations(cost_matrix, prefix):
+    """
+    Return the minimal tour starting with the prefix, by visiting every
+    permutation of the remaining cities.
+
+    The permutations are generated with Heap's algorithm, where each
+    permutation differs from the previous by one swap. A swap only changes
+    the edges next to the swapped cities, so the tour cost is updated from
+    those edges instead of summing the whole tour.
+
+    :param cost_matrix: Cost of path between cities
+    :type cost_matrix: list of lists
+    :param prefix: Cities at the start of every tour
+    :type prefix: list of integers
+    :return: Minimal tour cost, the tour and the number of tours searched
+    :rtype: tuple
+    """
+    number_of_cities = len(cost_matrix)
+    tour = list(prefix) + [city for city in range(number_of_cities)
+                           if city not in prefix]
+    cost = tsp.get_tour_cost(tour, cost_matrix)
+    min_cost, min_tour = cost, tour[:]
+    searched = 1
+
+    def get_edge_cost(edges):
+        """
+        Summed cost of edges, edge k goes from position k to the next
+        position of the tour.
+
+        :param edges: Edge positions
+        :type edges: set of integers
+        :return: Cost of the edges
+        :rtype: float
+        """
+        return sum(cost_matrix[tour[k]][tour[(k + 1) % number_of_cities]]
+                   for k in edges)
+
+    # Heap's algorithm over the positions after the prefix, the
+    # counters are the state of the loop
+    offset = len(prefix)
+    counters = [0] * (number_of_cities - offset)
+    i = 1
+    while i < len(counters):
+        if counters[i] < i:
+            # Pick the positions to swap
+            point_one = offset if i % 2 == 0 else offset + counters[i]
+            point_two = offset + i
+            # The edges into and out of the swapped positions change
+            edges = {(point_one - 1) % number_of_cities, point_one,
+                     point_two - 1, point_two}
+            cost -= get_edge_cost(edges)
+            tour[point_one], tour[point_two] = tour[point_two], tour[point_one]
+            cost += get_edge_cost(edges)
+            searched += 1
+            if cost < min_cost:
+                min_cost, min_tour = cost, tour[:]
+
+            counters[i] += 1
+            i = 1
+        else:
+            counters[i] = 0
+            i += 1
+
+    # Remove any rounding from the cost updates
+    return tsp.get_tour_cost(min_tour, cost_matrix), min_tour, searched
 
 
 def main():
@@ -348,12 +524,15 @@ def main():
                         help="Data for Travelling Salesman problem in a CSV file.")
     parser.add_argument("--tsp_exhaustive", action='store_true',
                         help="Perform exhaustive search of TSP.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of threads evaluating the fitness and "
+                             "processes in the exhaustive search")
     parser.add_argument("--verbose", action='store_true',
                         help="Verbose mode")
     args = parser.parse_args()
 
     # Set random seed for reproducibility
-    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
 
     global VERBOSE
     VERBOSE = args.verbose
@@ -364,15 +543,16 @@ def main():
     # Evolutionary Algorithm search
     ###########
     start_time = time.time()
-    best_solution = evolutionary_algorithm(args.population_size, args.generations,
+    best_genome, best_fitness = evolutionary_algorithm(args.population_size, args.generations,
                                            args.mutation_probability, args.crossover_probability,
-                                           args.tournament_size, args.elite_size, args.tsp_data)
+                                           args.tournament_size, args.elite_size, args.tsp_data,
+                                           rng, args.workers)
     execution_time = time.time() - start_time
     print("EA:\n Best tour cost is {} for path {}. Searched {} points in {:.5f} seconds".format(
-        best_solution['fitness'], best_solution['genome'], args.population_size * args.generations, execution_time))
+        best_fitness, best_genome.tolist(), args.population_size * args.generations, execution_time))
 
     if args.tsp_exhaustive:
-        tsp_exhaustive_search(args.tsp_data)
+        tsp_exhaustive_search(args.tsp_data, args.workers)
 
 
 if __name__ == '__main__':
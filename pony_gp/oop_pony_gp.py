@@ -27,8 +27,15 @@ import csv
 
 import random
 import math
+import os
 import copy
+import hashlib
+import tempfile
 import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 """
 Genetic Programming
@@ -51,6 +58,10 @@ out-of-sample performance of the evaluated expressions.
 
 """
 
+# Fitness function of a worker process
+WORKER_DATA = {}
+
+
 class Tree(object):
     """
     A Tree has a root which is an object of class TreeNode
@@ -226,24 +237,38 @@ class TreeNode(object):
         :rtype: str
         """
 
+        # Collect the parts of the s-expression and join them once, instead
+        # of concatenating the strings of the subtrees
+        parts = []
+        self.collect_str_as_tree(parts)
+        # Return the s-expression
+        return "".join(parts)
+
+    def collect_str_as_tree(self, parts):
+        """
+        Append the parts of the s-expression for the node and its
+        descendants, see `str_as_tree`.
+
+        :param parts: Parts of the s-expression
+        :type parts: list
+        """
+
         # The number of children determines if it is a internal or
         # leaf node
-        if len(self.children):
+        if self.children:
             # Append a ( before the symbol to denote the start of a subtree
-            _str = "(" + str(self.symbol)
+            parts.append("(" + str(self.symbol))
             # Iterate over the children
             for child in self.children:
                 # Append a " " between the child symbols
-                _str += " " + child.str_as_tree()
+                parts.append(" ")
+                child.collect_str_as_tree(parts)
 
             # Append a ) to close the subtree
-            _str += ")"
-
-            # Return the subtree string
-            return _str
+            parts.append(")")
         else:
-            # Return the symbol
-            return str(self.symbol)
+            # Append the symbol
+            parts.append(str(self.symbol))
 
 class Symbols(object):
     """
@@ -324,6 +349,8 @@ class Individual(object):
     Attributes:
       - Genome -- A tree
       - Fitness -- The fitness value of the individual
+      - Program -- The postfix program of the tree, None until the
+        individual is evaluated
 
     DEFAULT_FITNESS
       Default fitness value of an unevaluated individual
@@ -343,6 +370,8 @@ class Individual(object):
         self.genome = genome
         # Set the fitness to the default value
         self.fitness = Individual.DEFAULT_FITNESS
+        # The tree is flattened when the individual is evaluated
+        self.program = None
 
     def __lt__(self, other):
         """
@@ -381,25 +410,84 @@ class SymbolicRegression(object):
     
     - Fitness cases -- Input values for the exemplars
     - Targets -- The target values corresponding to the fitness case
-    - Variables -- The current value of the variables in the evaluated exemplar
+    - Variables -- The values of each variable in all the exemplars
+    - Cache -- Fitness of the recently evaluated trees, the s-expression of
+      a tree is the key
+    - Workers -- Number of processes the evaluation is spread over
+    - Executor -- Pool of the worker processes, created when the fitness
+      function is entered as a context manager with more than one worker
+
+    The tree of an individual is flattened to a postfix program, which is
+    evaluated once on all the exemplars with NumPy operations on the
+    variable columns.
+
+    CACHE_SIZE
+      Max number of fitness values in the cache
+
+    VARIABLE, CONSTANT, ADD, SUBTRACT, MULTIPLY, DIVIDE
+      Opcodes of the postfix programs
 
     """
 
-    def __init__(self, fitness_cases, targets):
+    CACHE_SIZE = 100000
+
+    VARIABLE, CONSTANT, ADD, SUBTRACT, MULTIPLY, DIVIDE = range(6)
+    # Opcodes of the function symbols
+    FUNCTION_OPCODES = {"+": ADD, "-": SUBTRACT, "*": MULTIPLY, "/": DIVIDE}
+
+    def __init__(self, fitness_cases, targets, workers=1):
         """ Constructor
 
         :param fitness_cases: Exemplar values
         :type fitness_cases: list
         :param targets: Value corresponding to the fitness cases
         :type targets: list
+        :param workers: Number of worker processes
+        :type workers: int
         """
-        #Matrix where each is row a case and each column is a variable
+        #Matrix where each is row a case and each column is a variable, as
+        #given, e.g. memory-mapped
         self.fitness_cases = fitness_cases
         #Each row is the response to the corresponding fitness cases
-        self.targets = targets
+        self.targets = np.asarray(targets, dtype=np.float64)
+        #Mean and variance of the targets, for the error of constant trees
+        self.target_mean = float(np.mean(self.targets))
+        self.target_variance = float(np.var(self.targets))
+        #Each row is a variable, contiguous for the evaluation. The
+        #variables of column-major cases are used without a copy
+        variables = np.asarray(fitness_cases, dtype=np.float64).T
+        if variables.strides[1] != variables.itemsize:
+            variables = np.ascontiguousarray(variables)
+        self.variables = variables
+        #Fitness of the trees, in least recently used order
+        self.cache = {}
+        #Number of worker processes
+        self.workers = workers
+        #Pool of the worker processes
+        self.executor = None
 
         assert len(self.fitness_cases) == len(self.targets)
 
+    def __enter__(self):
+        """Start the worker processes, with more than one worker. The
+        exemplars are sent to each worker once, the postfix programs of
+        the trees are sent for the evaluation.
+
+        :returns: The fitness function
+        :rtype: SymbolicRegression
+        """
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(
+                self.workers, initializer=initialize_worker,
+                initargs=(self.fitness_cases, self.targets))
+        return self
+
+    def __exit__(self, *exc_info):
+        """Shut down the worker processes."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
     def __call__(self, individual):
         """Evaluates and sets the fitness in an individual. Fitness is the
         negative mean square error(MSE).
@@ -407,29 +495,181 @@ class SymbolicRegression(object):
         :param individual: Individual solution to evaluate
         :type individual: Individual
         """
-        # Initial fitness value
-        fitness = 0.0
-        # Calculate the error between the output of the individual solution and
-        # the target for each input
-        for case, target in zip(self.fitness_cases, self.targets):
-            # Set the variables to be accessible for the evaluation function
-            self.variables = case
-            # Get output from evaluation function
-            output = self.evaluate(individual.genome.root)
-            # Get the squared error
-            error = output - target
-            fitness += error*error
-
-        # Get the mean fitness and assign it to the individual
-        individual.fitness = -fitness/float(len(self.targets))
+        self.evaluate_population([individual])
+
+    def evaluate_population(self, individuals):
+        """Evaluates and sets the fitness of each individual, see
+        `__call__`. The errors of all the individuals are computed at once.
+        A tree that is in the cache is not evaluated again.
+
+        :param individuals: Individual solutions to evaluate
+        :type individuals: list
+        """
+        # Individuals with the same tree that is not in the cache
+        unevaluated = {}
+        for individual in individuals:
+            # The s-expression of the tree is the cache key
+            key = individual.genome.root.str_as_tree()
+            if key in self.cache:
+                # Move the key to the end of the cache, it was used last
+                individual.fitness = self.cache[key] = self.cache.pop(key)
+            else:
+                unevaluated.setdefault(key, []).append(individual)
+
+        # Flatten each tree once, the individual keeps the program
+        programs = []
+        for same_tree in unevaluated.values():
+            individual = same_tree[0]
+            if individual.program is None:
+                individual.program = self.flatten_tree(individual.genome.root)
+            programs.append(individual.program)
+
+        if self.executor is None:
+            fitnesses = self.evaluate_programs(programs)
+        else:
+            # Send a few batches of programs to each worker
+            batch_size = max(1, len(programs) // (4 * self.workers))
+            batches = [programs[i:i + batch_size]
+                       for i in range(0, len(programs), batch_size)]
+            fitnesses = [fitness for batch_fitnesses in
+                         self.executor.map(evaluate_programs_in_worker,
+                                           batches)
+                         for fitness in batch_fitnesses]
+
+        # Assign the fitness to the individuals
+        for (key, same_tree), fitness in zip(unevaluated.items(), fitnesses):
+            self.cache[key] = fitness
+            # Drop the least recently used fitness when the cache is full
+            if len(self.cache) > SymbolicRegression.CACHE_SIZE:
+                del self.cache[next(iter(self.cache))]
+            for individual in same_tree:
+                individual.fitness = fitness
+
+    def evaluate_programs(self, programs):
+        """Return the fitness of postfix programs, see `flatten_tree`. The
+        errors of all the programs are computed at once.
+
+        :param programs: Postfix programs of trees
+        :type programs: list
+        :returns: Fitness of each program
+        :rtype: list
+        """
+        fitness = np.empty(len(programs))
+        # Output of each program with variables for each input
+        outputs = np.empty((len(programs), len(self.targets)))
+        # Index of the program of each row of the outputs
+        output_idx = []
+        # Overflows give inf, as with Python floats
+        with np.errstate(over="ignore", invalid="ignore"):
+            for i, program in enumerate(programs):
+                # Get output from the program for all the inputs
+                output = self.evaluate_program(program)
+                if isinstance(output, float):
+                    # A program without variables has the same output for
+                    # all the inputs. The mean square error is the variance
+                    # of the targets plus the square of the error of the mean
+                    error = output - self.target_mean
+                    fitness[i] = self.target_variance + error*error
+                else:
+                    outputs[len(output_idx)] = output
+                    output_idx.append(i)
+
+            # Calculate the squared error between the output of the
+            # individual solutions and the target for each input
+            error = outputs[:len(output_idx)] - self.targets
+            fitness[output_idx] = np.mean(error*error, axis=1)
+
+        # Get the negative mean fitness
+        return (-fitness).tolist()
+
+    @classmethod
+    def flatten_tree(cls, root):
+        """Return the postfix program of a tree. The program is a list of
+        (opcode, argument) pairs, the argument is the row of a variable, or
+        the value of a constant. The program does not depend on the
+        exemplars.
+
+        :param root: Root node of the tree
+        :type root: TreeNode
+        :returns: Postfix program
+        :rtype: list
+        """
+
+        program = []
+        # Visit the nodes in pre-order, with the children of a node in
+        # reverse
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            opcode = cls.FUNCTION_OPCODES.get(node.symbol)
+            if opcode is not None:
+                program.append((opcode, None))
+                stack.extend(node.children)
+            elif node.symbol.startswith("x"):
+                # The row of the variable values
+                program.append((cls.VARIABLE, int(node.symbol[1:])))
+            else:
+                #The symbol is a constant
+                program.append((cls.CONSTANT, float(node.symbol)))
+
+        # Reversing the visits puts the children in order before the node
+        program.reverse()
+        return program
+
+    def evaluate_program(self, program):
+        """Evaluate a postfix program, see `flatten_tree`. The program
+        computes the same value as `evaluate` for the root of its tree.
+
+        :param program: Postfix program
+        :type program: list
+        :returns: Value of the evaluation for each exemplar, a float if the
+          program has no variables
+        :rtype: np.ndarray
+        """
+
+        # Values of the evaluated subtrees. A function writes its values to
+        # the row of its position on the stack, so no arrays are allocated
+        # while the program is evaluated. A function of two constants is
+        # a constant
+        stack = []
+        rows = np.empty((len(program) // 2 + 1, len(self.targets)))
+        for opcode, argument in program:
+            if opcode == SymbolicRegression.VARIABLE:
+                # Get the variable values
+                stack.append(self.variables[argument])
+            elif opcode == SymbolicRegression.CONSTANT:
+                stack.append(argument)
+            else:
+                # The children of the node are on top of the stack
+                right = stack.pop()
+                left = stack.pop()
+                if isinstance(left, float) and isinstance(right, float):
+                    out = None
+                else:
+                    out = rows[len(stack)]
+                if opcode == SymbolicRegression.ADD:
+                    out = np.add(left, right, out=out)
+                elif opcode == SymbolicRegression.SUBTRACT:
+                    out = np.subtract(left, right, out=out)
+                elif opcode == SymbolicRegression.MULTIPLY:
+                    out = np.multiply(left, right, out=out)
+                else:
+                    # Too low values of the denominator returns the numerator
+                    out = np.divide(left, np.where(np.abs(right) < 0.00001,
+                                                   1.0, right), out=out)
+                stack.append(out)
+
+        # The value of the root
+        return stack.pop()
 
     def evaluate(self, node):        
-        """Evaluate a node recursively. The node's symbol is evaluated.
+        """Evaluate a node recursively. The node's symbol is evaluated for
+        all the exemplars at once.
 
         :param node: Evaluated node
         :type node: TreeNode
-        :returns: Value of the evaluation
-        :rtype: float
+        :returns: Value of the evaluation for each exemplar
+        :rtype: np.ndarray
         """
         
         #Identify the node symbol
@@ -450,18 +690,43 @@ class SymbolicRegression(object):
             # denominator returns the numerator
             numerator = self.evaluate(node.children[0])
             denominator = self.evaluate(node.children[1])
-            if abs(denominator) < 0.00001:
-                denominator = 1
-
-            return numerator / denominator
+            return numerator / np.where(np.abs(denominator) < 0.00001, 1.0,
+                                        denominator)
         elif node.symbol.startswith("x"):
-            # Get the variable value
+            # Get the variable values
             return self.variables[int(node.symbol[1:])]
         else:
             #The symbol is a constant
             return float(node.symbol)
 
 
+def initialize_worker(fitness_cases, targets):
+    """
+    Store a fitness function for the exemplars in a worker process, so they
+    are sent to the process once instead of with every evaluation.
+
+    :param fitness_cases: Exemplar values
+    :type fitness_cases: np.ndarray
+    :param targets: Value corresponding to the fitness cases
+    :type targets: np.ndarray
+    """
+    WORKER_DATA["fitness_function"] = SymbolicRegression(fitness_cases,
+                                                         targets)
+
+
+def evaluate_programs_in_worker(programs):
+    """
+    Return the fitness of postfix programs on the exemplars of the worker
+    process.
+
+    :param programs: Postfix programs of trees
+    :type programs: list
+    :returns: Fitness of each program
+    :rtype: list
+    """
+    return WORKER_DATA["fitness_function"].evaluate_programs(programs)
+
+
 class GP(object):
     """
     Genetic Programming implementation.
@@ -573,7 +838,8 @@ class GP(object):
     @classmethod
     def evaluate_fitness(cls, individuals, fitness_function):
         """
-        Perform the fitness evaluation for each individual.
+        Perform the fitness evaluation for each individual. The population
+        is evaluated as one batch by the fitness function.
 
         :param individuals: Population to evaluate
         :type individuals: list
@@ -581,10 +847,8 @@ class GP(object):
         :type fitness_function: Object
         """
 
-        # Iterate over all the individual solutions
-        for ind in individuals:
-            # Execute the builtin '__call__' method of the fitness function
-            fitness_function(ind)
+        # Evaluate all the individual solutions at once
+        fitness_function.evaluate_population(individuals)
 
     def search_loop(self, population):
         """
@@ -858,45 +1122,108 @@ class GP(object):
         return best_ever
 
 
-def parse_exemplars(file_name):
+def parse_exemplars(file_name, cache_dir=None):
     """
     Parse a CSV file. Parse the fitness case and split the data into
     Test and train data. In the fitness case file each row is an exemplar
     and each dimension is in a column. The last column is the target value of
     the exemplar.
 
+    The exemplars are stored column by column, so the fitness cases are a
+    column-major view where each variable is contiguous.
+
+    With a cache directory the parsed exemplars are saved there in a
+    `.exemplars.npy` file, which later runs memory-map instead of parsing
+    the CSV file again. The path, size and modification time of the CSV
+    file are part of the cache name, so a changed CSV file is parsed again.
+    The splits of the memory-mapped fitness cases are views, so they are
+    not read into memory at once.
+
     :param file_name: CSV file with header
     :type file_name: str
-    :return: Fitness cases and targets
-    :rtype: list
+    :param cache_dir: Directory of the cached exemplars, None to not cache
+    :type cache_dir: str
+    :return: Fitness cases, a row per case, and targets
+    :rtype: tuple
     """
 
-    # Open file
-    in_file = open(file_name, 'r')
-    # Create a CSV file reader
-    reader = csv.reader(in_file, delimiter=',')
+    cache_file_name = None
+    if cache_dir is not None:
+        # Binary file with the parsed exemplars
+        stat = os.stat(file_name)
+        path_hash = hashlib.sha1(
+            os.path.abspath(file_name).encode()).hexdigest()[:16]
+        cache_file_name = os.path.join(
+            cache_dir, '%s.%s.%d-%d.exemplars.npy' % (
+                os.path.basename(file_name), path_hash, stat.st_size,
+                stat.st_mtime_ns))
+
+    if cache_file_name is not None and os.path.exists(cache_file_name):
+        # The pages of the file are read when the exemplars are used
+        columns = np.load(cache_file_name, mmap_mode='r')
+    else:
+        # Open file
+        with open(file_name, 'r') as in_file:
+            # Create a CSV file reader
+            reader = csv.reader(in_file, delimiter=',')
+
+            # Read the header
+            headers = next(reader)
+            print("Reading: %s headers: %s" % (file_name, headers))
+
+            # Parse the rest of the file to floats at once
+            exemplars = np.loadtxt(in_file, delimiter=',', dtype=np.float64,
+                                   ndmin=2)
+        # Each row is a column of the file
+        columns = np.ascontiguousarray(exemplars.T)
+
+        if cache_file_name is not None:
+            save_exemplars(cache_file_name, columns)
+            # Use the memory-mapped exemplars, as later runs do
+            columns = np.load(cache_file_name, mmap_mode='r')
+
+    # The last column is the target
+    fitness_cases = columns[:-1].T
+    targets = columns[-1]
 
-    # Read the header
-    headers = reader.next()
-    print("Reading: %s headers: %s" % (file_name, headers))
-
-    # Store fitness cases and their target values
-    fitness_cases = []
-    targets = []
-    for row in reader:
-        # Parse the columns to floats and append to fitness cases
-        fitness_cases.append(map(float, row[:-1]))
-        # The last column is the target
-        targets.append(float(row[-1]))
+    return fitness_cases, targets
 
-    in_file.close()
 
-    return fitness_cases, targets
+def save_exemplars(cache_file_name, exemplars):
+    """
+    Save parsed exemplars to a cache file, see `parse_exemplars`.
 
+    :param cache_file_name: Name of the cache file
+    :type cache_file_name: str
+    :param exemplars: Parsed exemplars, a row per column of the file
+    :type exemplars: np.ndarray
+    """
 
+    directory, base_name = os.path.split(cache_file_name)
+    directory = directory or os.curdir
+    os.makedirs(directory, exist_ok=True)
+    # Write a temporary file in the same directory and rename it, so
+    # concurrent runs never load a partially written cache
+    handle, temporary_file_name = tempfile.mkstemp(
+        prefix=base_name + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as out_file:
+            np.save(out_file, exemplars)
+        # Readable like the other files in the directory, not only by the
+        # owner as a temporary file
+        os.chmod(temporary_file_name, 0o644)
+        os.replace(temporary_file_name, cache_file_name)
+    except BaseException:
+        os.remove(temporary_file_name)
+        raise
+
+
+@functools.lru_cache(maxsize=None)
 def get_arities():
     """
-    Return a symbol object. Helper method to keep the code clean.
+    Return a symbol object. Helper method to keep the code clean. The
+    object is created once and shared by all the calls, it is not changed
+    by the search.
 
     :return: Symbols used for GP individuals
     :rtype: Symbols
@@ -915,7 +1242,8 @@ def get_arities():
     return symbols
 
 
-def get_test_and_train_data(fitness_cases_file, test_train_split):
+def get_test_and_train_data(fitness_cases_file, test_train_split,
+                            cache_dir=None):
     """
     Return test and train data.
 
@@ -923,11 +1251,42 @@ def get_test_and_train_data(fitness_cases_file, test_train_split):
     :type fitness_cases_file: str
     :param test_train_split: Percentage of exemplar data used for training
     :type test_train_split: float
+    :param cache_dir: Directory of the cached exemplars, None to not cache
+    :type cache_dir: str
     :return: Test and train data. Both cases and targets
     :rtype: tuple
     """
 
-    fitness_cases, targets = parse_exemplars(fitness_cases_file)
+    # The modification time and size of the file are part of the cache key,
+    # so a changed file is parsed again
+    return load_test_and_train_data(fitness_cases_file, test_train_split,
+                                    os.path.getmtime(fitness_cases_file),
+                                    os.path.getsize(fitness_cases_file),
+                                    cache_dir)
+
+
+@functools.lru_cache(maxsize=4)
+def load_test_and_train_data(fitness_cases_file, test_train_split,
+                             modification_time, file_size, cache_dir=None):
+    """
+    Return test and train data, see `get_test_and_train_data`. The data of
+    the last files is cached, so repeated runs on a file parse it once.
+
+    :param fitness_cases_file: CSV file with a header.
+    :type fitness_cases_file: str
+    :param test_train_split: Percentage of exemplar data used for training
+    :type test_train_split: float
+    :param modification_time: Modification time of the file
+    :type modification_time: float
+    :param file_size: Size of the file in bytes
+    :type file_size: int
+    :param cache_dir: Directory of the cached exemplars, None to not cache
+    :type cache_dir: str
+    :return: Test and train data. Both cases and targets
+    :rtype: tuple
+    """
+
+    fitness_cases, targets = parse_exemplars(fitness_cases_file, cache_dir)
     # TODO get random cases instead of according to index
     split_idx = int(math.floor(len(fitness_cases) * test_train_split))
     training_cases = fitness_cases[:split_idx]
@@ -937,9 +1296,15 @@ def get_test_and_train_data(fitness_cases_file, test_train_split):
     return (test_cases, test_targets), (training_cases, training_targets)
 
 
-def main():
-    """Search. Evaluate best solution on out-of-sample data"""
-    
+@functools.lru_cache(maxsize=None)
+def get_parser():
+    """
+    Return the parser of the command line arguments. The parser is created
+    once and shared by all the calls.
+
+    :return: Command line argument parser
+    :rtype: argparse.ArgumentParser
+    """
     # Command line arguments
     parser = argparse.ArgumentParser()
     # Population size
@@ -968,11 +1333,23 @@ def main():
     # Fitness case file
     parser.add_argument("-fc", "--fitness_cases", default="",
                         help="fitness cases file")
+    # Directory of the memory-mapped fitness cases, not cached by default
+    parser.add_argument("-cd", "--cache_dir", default=None,
+                        help="directory to cache the parsed fitness cases in")
     # Test-training data split
     parser.add_argument("-tts", "--test_train_split", type=float, default=0.7,
                         help="test-train data split")
+    # Number of processes the fitness evaluation is spread over
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="number of worker processes")
+    return parser
+
+
+def main():
+    """Search. Evaluate best solution on out-of-sample data"""
+
     # Parse the command line arguments
-    args = parser.parse_args()
+    args = get_parser().parse_args()
 
     # Set arguments
 
@@ -984,26 +1361,28 @@ def main():
     crossover_probability = args.crossover
     mutation_probability = args.mutation
     test_train_split = args.test_train_split
-    fitness_cases_file = 'fitness_cases.csv'  # args.fitness_cases
+    fitness_cases_file = args.fitness_cases or 'fitness_cases.csv'
 
-    test, train = get_test_and_train_data(fitness_cases_file, test_train_split)
+    # Set random seed, 0 is a seed as well
+    random.seed(seed)
+
+    test, train = get_test_and_train_data(fitness_cases_file, test_train_split,
+                                          args.cache_dir)
 
     symbols = get_arities()
 
     # Print EA settings
     print(args, symbols.arities)
 
-    # Set random seed if not 0 is passed in as the seed
-    if seed != 0:
-        random.seed(seed)
-
-    fitness_function = SymbolicRegression(train[0], train[1])
-    gp = GP(population_size, max_size,
-            generations, elite_size, crossover_probability,
-            mutation_probability, fitness_function, symbols)
+    # The worker processes run for the whole search
+    with SymbolicRegression(train[0], train[1],
+                            args.workers) as fitness_function:
+        gp = GP(population_size, max_size,
+                generations, elite_size, crossover_probability,
+                mutation_probability, fitness_function, symbols)
 
-    best_ever = gp.run()
-    print("Best train:" + str(best_ever))
+        best_ever = gp.run()
+    print("Best train:%s" % best_ever)
     #Test on out-of-sample data
     out_of_sample_test(best_ever, test[0], test[1])
 
@@ -1021,7 +1400,11 @@ def out_of_sample_test(individual, fitness_cases, targets):
     """
     fitness_function = SymbolicRegression(fitness_cases, targets)
     fitness_function(individual)
-    print("Best test:" + str(individual))
+    # The genome is printed with the train fitness, only print the fitness
+    # and the shape of the tree
+    print("Best test: fitness:%f node_cnt:%d depth:%d" %
+          (individual.fitness, individual.genome.node_cnt,
+           individual.genome.depth))
 
 if __name__ == '__main__':
     main()
@@ -24,19 +24,23 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import csv
+import logging
 import optparse
 
-import random
 import math
-import copy
 import sys
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 """
 
 Implementation of Genetic Programming(GP), the purpose of this code is
 to describe how the algorithm works. The intended use is for
 teaching.
 The design is supposed to be simple, self contained and use core python
-libraries.
+libraries and NumPy. The fitness cases are NumPy arrays, so an individual
+is evaluated on all of them at once.
 
 See `oop_pony_gp.py` for a object orientated implementation.
 
@@ -45,10 +49,15 @@ Genetic Programming
 ===================
 
 
-An individual is a dictionary with two keys:
+An individual is a dictionary with the keys:
 
   - *genome* -- A tree
   - *fitness* -- The fitness of the evaluated tree
+  - *size* -- The number of nodes in the tree
+  - *depth* -- The max depth of the tree
+
+The size and depth are kept up to date by the variation operators, so the
+trees are not traversed to get them.
 
 The fitness is maximized.
 
@@ -82,7 +91,68 @@ The parameters for Pony GP are in a dictionary.
 .. codeauthor:: Erik Hemberg <hembergerik@csail.mit.edu>
 
 """
-DEFAULT_FITNESS = -sys.maxint
+DEFAULT_FITNESS = -sys.maxsize
+# Max number of fitness values kept in the cache
+CACHE_SIZE = 100000
+# Fitness cases and targets of a worker process
+WORKER_DATA = {}
+# Logger for the details of the search, shown with --verbose
+LOGGER = logging.getLogger(__name__)
+
+
+class RngPool(object):
+    """
+    Random numbers drawn in batches from a NumPy generator. Each call
+    takes the next number from the batch, instead of calling into the
+    `random` module.
+    """
+
+    def __init__(self, generator, size=65536):
+        """
+        :param generator: Random number generator
+        :type generator: np.random.Generator
+        :param size: Number of random numbers drawn at a time
+        :type size: int
+        """
+        self.generator = generator
+        self.size = size
+        self.values = []
+
+    def random(self):
+        """
+        Return a random float in [0, 1).
+
+        :returns: Random float
+        :rtype: float
+        """
+        if not self.values:
+            # Draw the next batch
+            self.values = self.generator.random(self.size).tolist()
+
+        return self.values.pop()
+
+    def randint(self, a, b):
+        """
+        Return a random integer in [a, b], including both end points.
+
+        :param a: Lowest integer
+        :type a: int
+        :param b: Highest integer
+        :type b: int
+        :returns: Random integer
+        :rtype: int
+        """
+        return a + int(self.random() * (b - a + 1))
+
+    def choice(self, seq):
+        """
+        Return a random element of a sequence.
+
+        :param seq: Sequence to chose from
+        :type seq: list
+        :returns: Random element
+        """
+        return seq[int(self.random() * len(seq))]
 
 
 def append_node(node, symbol):
@@ -103,10 +173,11 @@ def append_node(node, symbol):
     return new_node
 
 
-def grow(node, depth, max_depth, full, symbols):
+def grow(node, depth, max_depth, full, symbols, rng):
     """
-    Recursively grow a node to max depth in a pre-order, i.e. depth-first
-    left-to-right traversal.
+    Grow a node to max depth in a pre-order, i.e. depth-first
+    left-to-right traversal. The nodes that are growing are kept on a
+    stack instead of recursing.
 
     :param node: Root node of subtree
     :type node: list
@@ -118,22 +189,31 @@ def grow(node, depth, max_depth, full, symbols):
     :type full: bool
     :param symbols: set of symbols to chose from
     :type symbols: dict
+    :param rng: Random number generator
+    :type rng: RngPool
     """
 
-    # grow is called recursively in the loop. The loop iterates arity number
-    # of times. The arity is given by the node symbol
-    node_symbol = node[0]
-    for _ in range(symbols["arities"][node_symbol]):
+    arities = symbols["arities"]
+    # Stack of growing nodes and the depth of their children. A node grows
+    # until it has arity number of children. The arity is given by the
+    # node symbol
+    growing_nodes = [(node, depth)]
+    while growing_nodes:
+        node, depth = growing_nodes[-1]
+        assert depth <= max_depth, "%d %d" % (depth, max_depth)
+        if len(node) - 1 == arities[node[0]]:
+            # The node has all its children
+            growing_nodes.pop()
+            continue
+
         # Get a random symbol
-        symbol = get_random_symbol(depth, max_depth, symbols, full)
+        symbol = get_random_symbol(depth, max_depth, symbols, rng, full)
         # Create a child node and append it to the tree
         new_node = append_node(node, symbol)
-        # Call grow with the child node as the current node
-        grow(new_node, depth + 1, max_depth, full, symbols)
-
-        assert len(node) == (_ + 2), len(node)
-
-    assert depth <= max_depth, "%d %d" % (depth, max_depth)
+        # Grow the child node before the next child, a terminal has no
+        # children to grow
+        if arities[symbol] > 0:
+            growing_nodes.append((new_node, depth + 1))
 
 
 def get_children(node):
@@ -151,8 +231,8 @@ def get_children(node):
 
 def get_number_of_nodes(root, cnt):
     """
-    Return the number of nodes in the tree. A recursive depth-first
-    left-to-right search is done
+    Return the number of nodes in the tree. A depth-first left-to-right
+    search is done with a stack
 
     :param root: Root of tree
     :type root: list
@@ -163,57 +243,49 @@ def get_number_of_nodes(root, cnt):
 
     """
 
-    # Increase the count
-    cnt += 1
-    # Iterate over the children
-    for child in get_children(root):
-        # Recursively count the child nodes
-        cnt = get_number_of_nodes(child, cnt)
+    # Stack of unvisited nodes
+    unvisited_nodes = [root]
+    while unvisited_nodes:
+        node = unvisited_nodes.pop()
+        # Increase the count
+        cnt += 1
+        # Add the children to the stack
+        unvisited_nodes.extend(get_children(node))
 
     return cnt
 
 
-def get_node_at_index(root, idx):
+def get_preorder_nodes(root):
     """
-    Return the node in the tree at a given index. The index is
-    according to a depth-first left-to-right ordering.
+    Return the nodes of the tree and their depths in depth-first
+    left-to-right order. The node at an index is then looked up in the
+    list, instead of searching the tree for each index.
 
     :param root: Root of tree
     :type root: list
-    :param idx: Index of node to find
-    :type idx: int
-    :return: Node at the given index (based on depth-first left-to-right
-      indexing)
-    :rtype: list
+    :return: Nodes and the depth of each node
+    :rtype: tuple
     """
 
-    # Stack of unvisited nodes
-    unvisited_nodes = [root]
-    # Initial node is the same as the root
-    node = root
-    # Set the current index
-    cnt = 0
-    # Iterate over the tree until the index is reached
-    while cnt <= idx and unvisited_nodes:
+    nodes = []
+    depths = []
+    # Stack of unvisited nodes and their depths
+    unvisited_nodes = [(root, 0)]
+    while unvisited_nodes:
         # Take an unvisited node from the stack
-        node = unvisited_nodes.pop()
-        # Add the children of the node to the stack
-        # Get the children
-        children = get_children(node)
-        # Reverse the children before appending them to the stack
-        children.reverse()
-        # Add children to the stack
-        unvisited_nodes.extend(children)
-
-        # Increase the current index
-        cnt += 1
+        node, depth = unvisited_nodes.pop()
+        nodes.append(node)
+        depths.append(depth)
+        # Add the children in reverse order, so the leftmost is visited first
+        for child in reversed(node[1:]):
+            unvisited_nodes.append((child, depth + 1))
 
-    return node
+    return nodes, depths
 
 
 def get_max_tree_depth(root, depth, max_tree_depth):
     """
-    Return the max depth of the tree. Recursively traverse the tree
+    Return the max depth of the tree. Traverse the tree with a stack
 
     :param root: Root of the tree
     :type root: list
@@ -225,66 +297,25 @@ def get_max_tree_depth(root, depth, max_tree_depth):
     :rtype: int
     """
 
-    # Update the max depth if the current depth is greater
-    if max_tree_depth < depth:
-        max_tree_depth = depth
+    # Stack of unvisited nodes and their depths
+    unvisited_nodes = [(root, depth)]
+    while unvisited_nodes:
+        node, depth = unvisited_nodes.pop()
+        # Update the max depth if the current depth is greater
+        if max_tree_depth < depth:
+            max_tree_depth = depth
 
-    # Traverse the children of the root node
-    for child in get_children(root):
-        # Increase the depth
-        depth += 1
-        # Recursively get the depth of the child node
-        max_tree_depth = get_max_tree_depth(child, depth, max_tree_depth)
-        # Decrease the depth
-        depth -= 1
-
-    assert depth <= max_tree_depth
+        # Add the children of the node to the stack
+        for child in get_children(node):
+            unvisited_nodes.append((child, depth + 1))
 
     return max_tree_depth
 
 
-def get_depth_from_index(node, idx, node_idx, depth, idx_depth=None):
-    """
-    Return the depth of a node based on the index. The index is based on
-    depth-first left-to-right traversal.
-
-    TODO implement breakout
-
-    :param node: Current node
-    :type node: list
-    :param idx: Current index
-    :type idx: int
-    :param node_idx: Index of the node which depth we are searching for
-    :type node_idx: int
-    :param depth: Current depth
-    :type depth: int
-    :param idx_depth: Depth of the node at the given index
-    :type idx_depth: int
-    :return: Current index and depth of the node at the given index
-    :rtype: tuple
-    """
-
-    # Assign the current depth when the current index matches the given index
-    if node_idx == idx:
-        idx_depth = depth
-
-    idx += 1
-    # Iterate over the children
-    for child in get_children(node):
-        # Increase the depth
-        depth += 1
-        # Recursively check the child depth and node index
-        idx_depth, idx = get_depth_from_index(child, idx, node_idx, depth,
-                                              idx_depth)
-        # Decrease the depth
-        depth -= 1
-
-    return idx_depth, idx
-
-
 def replace_subtree(new_subtree, old_subtree):
     """
-    Replace a subtree.
+    Replace a subtree. The old subtree gets the symbol and the children of
+    the new subtree, the children are not copied.
 
     :param new_subtree: The new subtree
     :type new_subtree: list
@@ -292,47 +323,25 @@ def replace_subtree(new_subtree, old_subtree):
     :type old_subtree: list
     """
 
-    # Delete the nodes of the old subtree
-    del old_subtree[:]
-    for node in new_subtree:
-        # Insert the nodes in the new subtree
-        old_subtree.append(copy.deepcopy(node))
+    # Replace the nodes of the old subtree with the nodes of the new subtree
+    old_subtree[:] = new_subtree
 
 
-def find_and_replace_subtree(root, subtree, node_idx, idx):
+def copy_tree(node):
     """
-    Returns the current index and replaces the root with another subtree at the
-    given index. The index is based on depth-first left-to-right traversal.
-
-    TODO breakout when root is replaced with subtree
+    Return a copy of a tree. The symbols are strings and are shared, only
+    the lists of the nodes are copied, which is much faster than
+    `copy.deepcopy`.
 
-    :param root: Root of the tree
-    :type root: list
-    :param subtree: Subtree that will replace the root
-    :type subtree: list
-    :param node_idx: Index of the node to be replaced
-    :type node_idx: int
-    :param idx: Current index
-    :type idx: int
-    :return: Current index
-    :rtype: int
+    :param node: Root of the tree to copy
+    :type node: list
+    :return: Copy of the tree
+    :rtype: list
     """
+    return [node[0]] + [copy_tree(child) for child in node[1:]]
 
-    # Check if index is the given node idx for replacement
-    if node_idx == idx:
-        # Replace the subtree
-        replace_subtree(subtree, root)
-    else:
-        # Iterate over the children
-        for child in get_children(root):
-            # Recursively traverse the tree
-            idx = idx + 1
-            idx = find_and_replace_subtree(child, subtree, node_idx, idx)
-
-    return idx
 
-
-def get_random_symbol(depth, max_depth, symbols, full=False):
+def get_random_symbol(depth, max_depth, symbols, rng, full=False):
     """
     Return a randomly chosen symbol. The depth determines if a terminal
     must be chosen. If `full` is specified a function will be chosen
@@ -345,6 +354,8 @@ def get_random_symbol(depth, max_depth, symbols, full=False):
     :type max_depth: int
     :param symbols: The possible symbols.
     :type symbols: dict
+    :param rng: Random number generator
+    :type rng: RngPool
     :param full: True if function symbols should be drawn until max depth
     :returns: A random symbol
     :rtype: str
@@ -352,19 +363,20 @@ def get_random_symbol(depth, max_depth, symbols, full=False):
     """
     assert depth <= max_depth, "%d %d" % (depth, max_depth)
 
+    terminals = symbols["terminals"]
     # Pick a terminal if max depth has been reached
     if depth >= (max_depth - 1):
         # Pick a random terminal
-        symbol = random.choice(symbols["terminals"])
+        symbol = rng.choice(terminals)
     else:
         # Can it be a terminal before the max depth is reached
         # then there is 50% chance that it is a terminal
-        if not full and bool(random.getrandbits(1)):
+        if not full and rng.random() < 0.5:
             # Pick a random terminal
-            symbol = random.choice(symbols["terminals"])
+            symbol = rng.choice(terminals)
         else:
             # Pick a random function
-            symbol = random.choice(symbols["functions"])
+            symbol = rng.choice(symbols["functions"])
 
     # Return the picked symbol
     return symbol
@@ -389,87 +401,284 @@ def sort_population(individuals):
     return individuals
 
 
-def evaluate_individual(individual, fitness_cases, targets, symbols=None):
+def evaluate_individual(genome, fitness_cases, targets, symbols=None):
     """
     Evaluate fitness based on fitness cases and target values. Fitness
     cases are a set of exemplars (input and output points) by
     comparing the error between the output of an individual(symbolic
     expression) and the target values.
 
-    Evaluates and sets the fitness in an individual. Fitness is the
-    negative mean square error(MSE).
+    Returns the fitness of the genome of an individual and its output
+    for each fitness case. Fitness is the negative mean square
+    error(MSE). The genome is not changed, so the evaluation can run in
+    another process.
 
-    :param individual: Individual solution to evaluate
-    :type individual: dict
-    :param fitness_cases: Input for the evaluation
-    :type fitness_cases: list
+    :param genome: Genome of the individual solution to evaluate
+    :type genome: list
+    :param fitness_cases: Input for the evaluation, a row per case
+    :type fitness_cases: np.ndarray
     :param targets: Output corresponding to the input
-    :type targets: list
+    :type targets: np.ndarray
     :param symbols: Symbols used in evaluation
     :type symbols: dict
+    :return: Fitness and the output for each case
+    :rtype: tuple
     """
+    outputs = get_outputs([compile_genome(genome)], fitness_cases)
+    return get_fitness(outputs, targets)[0], outputs[0]
 
-    # Initial fitness value
-    fitness = 0.0
-    # Calculate the error between the output of the individual solution and
-    # the target for each input
-    for case, target in zip(fitness_cases, targets):
-        # Get output from evaluation function
-        output = evaluate(individual["genome"], case)
-        # Get the squared error
-        error = output - target
-        fitness += error * error
 
-    assert fitness >= 0
-    # Get the mean fitness and assign it to the individual
-    individual["fitness"] = -fitness / float(len(targets))
+def evaluate_expressions(expressions, fitness_cases, targets):
+    """
+    Returns the fitness of the Python expressions of genomes, see
+    `evaluate_individual`. An expression is the flat form of a genome, it
+    is the cache key of the fitness and is sent to the worker processes
+    instead of the tree.
+
+    The expressions are evaluated as a batch. The columns of the fitness
+    cases are bound once for all the expressions and the errors of all of
+    them are computed at once.
+
+    :param expressions: Python expressions of genomes
+    :type expressions: list
+    :param fitness_cases: Input for the evaluation, a row per case
+    :type fitness_cases: np.ndarray
+    :param targets: Output corresponding to the input
+    :type targets: np.ndarray
+    :return: Fitness of each expression
+    :rtype: list
+    """
 
-    assert individual['fitness'] <= 0
+    return get_fitness(get_outputs(expressions, fitness_cases), targets)
 
 
-def evaluate(node, case):
+def get_outputs(expressions, fitness_cases):
+    """
+    Return the output of the Python expressions of genomes for each
+    fitness case.
+
+    :param expressions: Python expressions of genomes
+    :type expressions: list
+    :param fitness_cases: Input for the evaluation, a row per case
+    :type fitness_cases: np.ndarray
+    :return: Output of each expression, a row per expression
+    :rtype: np.ndarray
     """
-    Evaluate a node recursively. The node's symbol string is evaluated.
 
-    :param node: Evaluated node
+    # Contiguous columns of the variables for the compiled expressions, a
+    # view for fitness cases stored column by column
+    columns = tuple(np.ascontiguousarray(fitness_cases.T))
+    # Output of each expression for each fitness case
+    outputs = np.empty((len(expressions), len(fitness_cases)),
+                       dtype=fitness_cases.dtype)
+    # Overflows give inf, as with Python floats
+    with np.errstate(over="ignore", invalid="ignore"):
+        for i, expression in enumerate(expressions):
+            # Get output for all the fitness cases from the compiled genome
+            output = compile_expression(expression)(columns)
+            # The expression is computed in the type of the fitness cases
+            assert np.ndim(output) == 0 or output.dtype == fitness_cases.dtype
+            outputs[i] = output
+
+    return outputs
+
+
+def get_fitness(outputs, targets):
+    """
+    Return the fitness of each row of outputs, see `evaluate_individual`.
+
+    :param outputs: Output of each expression, a row per expression
+    :type outputs: np.ndarray
+    :param targets: Output corresponding to the input
+    :type targets: np.ndarray
+    :return: Fitness of each row
+    :rtype: list
+    """
+
+    with np.errstate(over="ignore", invalid="ignore"):
+        # Calculate the squared error between the output of the individual
+        # solutions and the target for each input
+        error = outputs - targets
+        fitness = np.mean(error * error, axis=1)
+
+    assert np.all(fitness >= 0)
+    # Get the negative mean fitness
+    fitness = -fitness
+
+    assert np.all(fitness <= 0)
+
+    return fitness.tolist()
+
+
+def initialize_worker(fitness_cases, targets):
+    """
+    Store the fitness cases and targets in a worker process, so they are
+    sent to the process once instead of with every evaluation.
+
+    :param fitness_cases: Input for the evaluation
+    :type fitness_cases: np.ndarray
+    :param targets: Output corresponding to the input
+    :type targets: np.ndarray
+    """
+    WORKER_DATA["fitness_cases"] = fitness_cases
+    WORKER_DATA["targets"] = targets
+
+
+def evaluate_expressions_in_worker(expressions):
+    """
+    Return the fitness of the Python expressions of genomes on the fitness
+    cases of the worker process.
+
+    :param expressions: Python expressions of genomes
+    :type expressions: list
+    :return: Fitness of each expression
+    :rtype: list
+    """
+    return evaluate_expressions(expressions, WORKER_DATA["fitness_cases"],
+                                WORKER_DATA["targets"])
+
+
+def protected_division(numerator, denominator):
+    """
+    Return the numerator divided by the denominator, elementwise. Too low
+    values of the denominator returns the numerator.
+
+    :param numerator: Numerator
+    :type numerator: np.ndarray
+    :param denominator: Denominator
+    :type denominator: np.ndarray
+    :returns: Value of the division
+    :rtype: np.ndarray
+    """
+    if np.ndim(denominator) == 0:
+        # A constant stays a scalar, a 0-d array would promote the
+        # division of float32 columns to float64
+        return numerator / (1.0 if abs(denominator) < 0.00001 else
+                            denominator)
+
+    return numerator / np.where(np.abs(denominator) < 0.00001,
+                                denominator.dtype.type(1), denominator)
+
+
+# Functions of the function symbols, used by `evaluate`
+FUNCTIONS = {
+    "+": np.add,
+    "-": np.subtract,
+    "*": np.multiply,
+    "/": protected_division,
+}
+# Python expressions of the function symbols, used by `compile_genome`
+FUNCTION_EXPRESSIONS = {
+    "+": "(%s+%s)",
+    "-": "(%s-%s)",
+    "*": "(%s*%s)",
+    "/": "protected_division(%s,%s)",
+}
+
+
+def compile_genome(node):
+    """
+    Return the Python expression of a node. The expression computes the
+    same value as `evaluate` for the fitness cases, with `columns` the
+    columns of the fitness cases.
+
+    :param node: Compiled node
     :type node: list
-    :param case: Current fitness case
-    :type case: list
-    :returns: Value of the evaluation
-    :rtype: float
+    :returns: Python expression
+    :rtype: str
     """
 
     symbol = node[0]
-    # Identify the node symbol
-    if symbol == "+":
-        # Add the values of the node's children
-        return evaluate(node[1], case) + evaluate(node[2], case)
+    # Look up the expression of a function symbol
+    function_expression = FUNCTION_EXPRESSIONS.get(symbol)
+    if function_expression is not None:
+        # Combine the expressions of the node's children
+        return function_expression % (compile_genome(node[1]),
+                                      compile_genome(node[2]))
+
+    return compile_terminal(symbol)
 
-    elif symbol == "-":
-        # Subtract the values of the node's children
-        return evaluate(node[1], case) - evaluate(node[2], case)
 
-    elif symbol == "*":
-        # Multiply the values of the node's children
-        return evaluate(node[1], case) * evaluate(node[2], case)
+@functools.lru_cache(maxsize=None)
+def compile_terminal(symbol):
+    """
+    Return the Python expression of a terminal symbol. The symbol is only
+    parsed the first time it is compiled.
 
-    elif symbol == "/":
-        # Divide the value's of the nodes children. Too low values of the
-        # denominator returns the numerator
-        numerator = evaluate(node[1], case)
-        denominator = evaluate(node[2], case)
-        if abs(denominator) < 0.00001:
-            denominator = 1
+    :param symbol: Terminal symbol
+    :type symbol: str
+    :returns: Python expression
+    :rtype: str
+    """
+    variable_index, value = parse_terminal(symbol)
+    if variable_index is not None:
+        # Get the variable column
+        return "columns[%d]" % variable_index
 
-        return numerator / denominator
+    # The symbol is a constant
+    return repr(value)
 
-    elif symbol.startswith("x"):
-        # Get the variable value
-        return case[int(symbol[1:])]
 
-    else:
-        # The symbol is a constant
-        return float(symbol)
+@functools.lru_cache(maxsize=None)
+def parse_terminal(symbol):
+    """
+    Return the variable index and the value of a terminal symbol. The
+    index is None for a constant and the value is None for a variable.
+
+    :param symbol: Terminal symbol
+    :type symbol: str
+    :returns: Variable index and constant value
+    :rtype: tuple
+    """
+    if symbol.startswith("x"):
+        return int(symbol[1:]), None
+
+    return None, float(symbol)
+
+
+@functools.lru_cache(maxsize=4096)
+def compile_expression(expression):
+    """
+    Return a function of the columns of the fitness cases computing the
+    Python expression. The compiled functions are cached, so an expression
+    that reappears in the search is not compiled again.
+
+    :param expression: Python expression of a genome
+    :type expression: str
+    :returns: Function of the columns of the fitness cases
+    :rtype: function
+    """
+    return eval("lambda columns: " + expression,
+                {"protected_division": protected_division})
+
+
+def evaluate(node, cases):
+    """
+    Evaluate a node recursively on all the fitness cases. The node's
+    symbol string is evaluated. Reference for `compile_genome`.
+
+    :param node: Evaluated node
+    :type node: list
+    :param cases: Fitness cases, a row per case
+    :type cases: np.ndarray
+    :returns: Value of the evaluation for each case
+    :rtype: np.ndarray
+    """
+
+    symbol = node[0]
+    # Look up the function of the symbol
+    function = FUNCTIONS.get(symbol)
+    if function is not None:
+        # Apply the function to the values of the node's children
+        return function(evaluate(node[1], cases), evaluate(node[2], cases))
+
+    variable_index, value = parse_terminal(symbol)
+    if variable_index is not None:
+        # Get the variable column
+        return cases[:, variable_index]
+
+    # The symbol is a constant
+    return value
 
 
 def initialize_population(param):
@@ -487,33 +696,42 @@ def initialize_population(param):
     individuals = []
     for i in range(param["population_size"]):
         # Pick full or grow method
-        full = bool(random.getrandbits(1))
+        full = param["rng"].random() < 0.5
         # Ramp the depth
         max_depth = (i % param["max_depth"]) + 1
         # Create root node
-        symbol = get_random_symbol(0, max_depth, param["symbols"])
+        symbol = get_random_symbol(0, max_depth, param["symbols"],
+                                   param["rng"])
         tree = [symbol]
         # Grow the tree if the root is a function symbol
         if max_depth > 0 and symbol in param["symbols"]["functions"]:
-            grow(tree, 1, max_depth, full, param["symbols"])
+            grow(tree, 1, max_depth, full, param["symbols"], param["rng"])
 
             assert get_max_tree_depth(tree, 0, 0) < (max_depth + 1)
 
         # An individual is a dictionary
-        individual = {"genome": tree, "fitness": DEFAULT_FITNESS}
+        individual = {
+            "genome": tree,
+            "fitness": DEFAULT_FITNESS,
+            "size": get_number_of_nodes(tree, 0),
+            "depth": get_max_tree_depth(tree, 0, 0)
+        }
         # Append the individual to the population
         individuals.append(individual)
-        print('Initial tree nr:%d nodes:%d max_depth:%d: %s' %
-              (i, get_number_of_nodes(tree, 0), get_max_tree_depth(tree, 0, 0),
-               tree))
+        # The message is only formatted if debug logging is enabled
+        LOGGER.debug('Initial tree nr:%d nodes:%d max_depth:%d: %s', i,
+                     individual["size"], individual["depth"], tree)
 
     return individuals
 
 
 def evaluate_fitness(individuals, param, cache):
     """
-    Evaluation each individual of the population.
+    Evaluation each individual of the population that has no fitness.
     Uses a simple cache for reducing number of evaluations of individuals.
+    The cache keeps the `CACHE_SIZE` most recently used fitness values.
+    The evaluations are independent, with an executor in the parameters
+    they are spread over its worker processes.
 
     :param individuals: Population to evaluate
     :type individuals: list
@@ -523,18 +741,45 @@ def evaluate_fitness(individuals, param, cache):
     :type cache: dict
     """
 
-    # Iterate over all the individual solutions
+    # Individuals with the same expression that is not in the cache
+    unevaluated = {}
+    # Iterate over the individual solutions without a fitness
     for ind in individuals:
-        # The string representation of the tree is the cache key
-        key = str(ind["genome"])
-        if key in cache.keys():
-            ind["fitness"] = cache[key]
+        if ind["fitness"] != DEFAULT_FITNESS:
+            continue
+
+        # The compiled expression of the tree is the cache key
+        key = compile_genome(ind["genome"])
+        if key in cache:
+            # Move the key to the end of the cache, it was used last
+            ind["fitness"] = cache[key] = cache.pop(key)
         else:
-            # Execute the fitness function
-            evaluate_individual(ind, param["fitness_cases"], param["targets"],
-                                param["symbols"])
-            cache[key] = ind["fitness"]
+            unevaluated.setdefault(key, []).append(ind)
 
+    # Execute the fitness function once per expression
+    expressions = list(unevaluated)
+    if param["executor"] is None:
+        fitnesses = evaluate_expressions(expressions, param["fitness_cases"],
+                                         param["targets"])
+    else:
+        # Send a few batches of expressions to each worker
+        batch_size = max(1, len(expressions) // (4 * param["workers"]))
+        batches = [expressions[i:i + batch_size]
+                   for i in range(0, len(expressions), batch_size)]
+        fitnesses = [fitness for batch_fitnesses in
+                     param["executor"].map(evaluate_expressions_in_worker,
+                                           batches)
+                     for fitness in batch_fitnesses]
+
+    for (key, inds), fitness in zip(unevaluated.items(), fitnesses):
+        cache[key] = fitness
+        # Drop the least recently used fitness when the cache is full
+        if len(cache) > CACHE_SIZE:
+            del cache[next(iter(cache))]
+        for ind in inds:
+            ind["fitness"] = fitness
+
+    for ind in individuals:
         assert ind["fitness"] >= DEFAULT_FITNESS
 
 
@@ -551,14 +796,16 @@ def search_loop(population, param):
     :rtype: Individual
     """
 
+    # Look up the parameters used in the loop once
+    rng = param["rng"]
+    population_size = param["population_size"]
     # Evaluate fitness
     cache = {}
     evaluate_fitness(population, param, cache)
     # Print the stats of the population
     print_stats(0, population)
     # Set best solution
-    sort_population(population)
-    best_ever = population[0]
+    best_ever = max(population, key=lambda x: x["fitness"])
 
     # Generation loop
     generation = 1
@@ -568,24 +815,24 @@ def search_loop(population, param):
         parents = tournament_selection(population, param)
 
         # Crossover
-        while len(new_population) < param["population_size"]:
-            # Select parents
-            _parents = random.sample(parents, 2)
+        while len(new_population) < population_size:
+            # Select two different parents
+            i = rng.randint(0, len(parents) - 1)
+            j = rng.randint(0, len(parents) - 2)
+            if j >= i:
+                j += 1
             # Generate children by crossing over the parents
-            children = subtree_crossover(_parents[0], _parents[1], param)
-            # Append the children to the new population
+            children = subtree_crossover(parents[i], parents[j], param)
             for child in children:
-                new_population.append(child)
-
-        # Select population size individuals. Handles uneven population
-        # sizes, since crossover returns 2 offspring
-        new_population = new_population[:param["population_size"]]
-
-        # Vary the population by mutation
-        for i in range(len(new_population)):
-            new_population[i] = subtree_mutation(new_population[i], param)
-
-        # Evaluate fitness
+                # Select population size individuals. Handles uneven
+                # population sizes, since crossover returns 2 offspring
+                if len(new_population) < population_size:
+                    # Vary the child by mutation and append it to the new
+                    # population
+                    new_population.append(subtree_mutation(child, param))
+
+        # Evaluate fitness of the children that were varied, in one batch
+        # so they can be spread over the workers
         evaluate_fitness(new_population, param, cache)
 
         # Replace population
@@ -593,8 +840,7 @@ def search_loop(population, param):
                                               param)
 
         # Set best solution
-        sort_population(population)
-        best_ever = population[0]
+        best_ever = max(population, key=lambda x: x["fitness"])
 
         # Print the stats of the population
         print_stats(generation, population)
@@ -629,14 +875,14 @@ def print_stats(generation, individuals):
             float(sum((value - _ave)**2 for value in values)) / len(values))
         return _ave, _std
 
-    # Make sure individuals are sorted
-    sort_population(individuals)
+    # Get the best individual
+    best = max(individuals, key=lambda x: x["fitness"])
     # Get the fitness values
     fitness_values = [i["fitness"] for i in individuals]
     # Get the number of nodes
-    size_values = [get_number_of_nodes(i["genome"], 0) for i in individuals]
+    size_values = [i["size"] for i in individuals]
     # Get the max depth
-    depth_values = [get_max_tree_depth(i["genome"], 0, 0) for i in individuals]
+    depth_values = [i["depth"] for i in individuals]
     # Get average and standard deviation of fitness
     ave_fit, std_fit = get_ave_and_std(fitness_values)
     # Get average and standard deviation of size
@@ -648,14 +894,15 @@ def print_stats(generation, individuals):
           "depth_ave:%.2f+-%.3f max_size:%d max_depth:%d max_fit:%f "
           "best_solution:%s" %
           (generation, ave_fit, std_fit, ave_size, std_size, ave_depth,
-           std_depth, max(size_values), max(depth_values), max(fitness_values),
-           individuals[0]))
+           std_depth, max(size_values), max(depth_values), best["fitness"],
+           best))
 
 
 def subtree_mutation(individual, param):
     """
     Return a new individual by randomly picking a node and growing a
-    new subtree from it.
+    new subtree from it. The genome is only copied if it is mutated, an
+    individual that is not mutated keeps its fitness.
 
     :param individual: Individual to mutate
     :type individual: dict
@@ -665,42 +912,54 @@ def subtree_mutation(individual, param):
     :rtype: dict
     """
 
-    # Copy the individual for mutation
+    # Look up the parameters used by the mutation once
+    rng = param["rng"]
+    max_depth = param["max_depth"]
+    symbols = param["symbols"]
+    # The new individual shares the genome and fitness until it is mutated
     new_individual = {
-        "genome": copy.deepcopy(individual["genome"]),
-        "fitness": DEFAULT_FITNESS
+        "genome": individual["genome"],
+        "fitness": individual["fitness"],
+        "size": individual["size"],
+        "depth": individual["depth"]
     }
     # Check if mutation should be applied
-    if random.random() < param["mutation_probability"]:
+    if rng.random() < param["mutation_probability"]:
+        # Copy the genome for mutation
+        new_individual["genome"] = copy_tree(individual["genome"])
+        new_individual["fitness"] = DEFAULT_FITNESS
         # Pick random node
-        end_node_idx = get_number_of_nodes(new_individual["genome"], 0) - 1
-        node_idx = random.randint(0, end_node_idx)
-        # Get node depth
-        node_depth, cnt = get_depth_from_index(new_individual["genome"], 0,
-                                               node_idx, 0)
-        assert param["max_depth"] >= node_depth
+        end_node_idx = new_individual["size"] - 1
+        node_idx = rng.randint(0, end_node_idx)
+        # Get the node and its depth
+        nodes, depths = get_preorder_nodes(new_individual["genome"])
+        old_subtree = nodes[node_idx]
+        node_depth = depths[node_idx]
+        assert max_depth >= node_depth
 
         # Get a new symbol for the subtree
         new_subtree = [
-            get_random_symbol(node_depth, param["max_depth"], param["symbols"])
+            get_random_symbol(node_depth, max_depth, symbols, rng)
         ]
         # Grow tree if it is a function symbol
-        if new_subtree[0] in param["symbols"]["functions"]:
+        if new_subtree[0] in symbols["functions"]:
             # Grow to full depth?
-            full = bool(random.getrandbits(1))
+            full = rng.random() < 0.5
             # Grow subtree
-            grow(new_subtree, node_depth, param["max_depth"], full,
-                 param["symbols"])
+            grow(new_subtree, node_depth, max_depth, full, symbols, rng)
 
         assert get_max_tree_depth(new_subtree, node_depth, 0) \
-               <= param["max_depth"]
+               <= max_depth
 
+        # Update the size with the nodes of the replaced subtree
+        new_individual["size"] += get_number_of_nodes(new_subtree, 0) - \
+            get_number_of_nodes(old_subtree, 0)
         # Replace the original subtree with the new subtree
-        find_and_replace_subtree(new_individual["genome"], new_subtree,
-                                 node_idx, 0)
+        replace_subtree(new_subtree, old_subtree)
+        new_individual["depth"] = get_max_tree_depth(new_individual["genome"],
+                                                     0, 0)
 
-        assert get_max_tree_depth(new_individual["genome"], 0, 0) \
-               <= param["max_depth"]
+        assert new_individual["depth"] <= max_depth
 
     # Return the individual
     return new_individual
@@ -710,7 +969,8 @@ def subtree_crossover(parent1, parent2, param):
     """
     Returns two individuals. The individuals are created by
     selecting two random nodes from the parents and swapping the
-    subtrees.
+    subtrees. The genomes are only copied if they are crossed over,
+    offsprings that are not crossed over keep the fitness of the parent.
 
     :param parent1: Parent one to crossover
     :type parent1: dict
@@ -721,48 +981,64 @@ def subtree_crossover(parent1, parent2, param):
     :return: Children from the crossed over parents
     :rtype: tuple
     """
-    # Copy the parents to make offsprings
+    # Look up the parameters used by the crossover once
+    rng = param["rng"]
+    max_depth = param["max_depth"]
+    # The offsprings share the genomes and fitness of the parents until
+    # they are crossed over
     offsprings = ({
-        "genome": copy.deepcopy(parent1["genome"]),
-        "fitness": DEFAULT_FITNESS
+        "genome": parent1["genome"],
+        "fitness": parent1["fitness"],
+        "size": parent1["size"],
+        "depth": parent1["depth"]
     }, {
-        "genome": copy.deepcopy(parent2["genome"]),
-        "fitness": DEFAULT_FITNESS
+        "genome": parent2["genome"],
+        "fitness": parent2["fitness"],
+        "size": parent2["size"],
+        "depth": parent2["depth"]
     })
 
     # Check if offspring will be crossed over
-    if random.random() < param["crossover_probability"]:
+    if rng.random() < param["crossover_probability"]:
+        # Copy the parents to make offsprings
+        for offspring in offsprings:
+            offspring["genome"] = copy_tree(offspring["genome"])
+
         xo_nodes = []
         node_depths = []
         for i, offspring in enumerate(offsprings):
             # Pick a crossover point
-            end_node_idx = get_number_of_nodes(offsprings[i]["genome"], 0) - 1
-            node_idx = random.randint(0, end_node_idx)
+            end_node_idx = offspring["size"] - 1
+            node_idx = rng.randint(0, end_node_idx)
             # Find the subtree at the crossover point
-            xo_nodes.append(
-                get_node_at_index(offsprings[i]["genome"], node_idx))
+            nodes, _ = get_preorder_nodes(offspring["genome"])
+            xo_nodes.append(nodes[node_idx])
             xo_point_depth = get_max_tree_depth(xo_nodes[-1], 0, 0)
-            offspring_depth = get_max_tree_depth(offspring["genome"], 0, 0)
-            node_depths.append((xo_point_depth, offspring_depth))
+            node_depths.append((xo_point_depth, offspring["depth"]))
 
         # Make sure that the offspring is deep enough
-        if (node_depths[0][1] + node_depths[1][0]) >= param["max_depth"] or \
-                        (node_depths[1][1] + node_depths[0][0]) >= param[
-                    "max_depth"]:
+        if (node_depths[0][1] + node_depths[1][0]) >= max_depth or \
+                        (node_depths[1][1] + node_depths[0][0]) >= max_depth:
             return offsprings
 
-        # Swap the nodes
-        tmp_offspring_1_node = copy.deepcopy(xo_nodes[1])
-        # Copy the children from the subtree of the first offspring
+        # Update the sizes with the nodes of the swapped subtrees
+        xo_sizes = [get_number_of_nodes(node, 0) for node in xo_nodes]
+        offsprings[0]["size"] += xo_sizes[1] - xo_sizes[0]
+        offsprings[1]["size"] += xo_sizes[0] - xo_sizes[1]
+        # Swap the nodes. The offsprings are copies, so the children are
+        # moved between them without copying
+        tmp_offspring_1_node = xo_nodes[1][:]
+        # Move the children from the subtree of the first offspring
         # to the chosen node of the second offspring
         replace_subtree(xo_nodes[0], xo_nodes[1])
-        # Copy the children from the subtree of the second offspring
+        # Move the children from the subtree of the second offspring
         # to the chosen node of the first offspring
         replace_subtree(tmp_offspring_1_node, xo_nodes[0])
 
         for offspring in offsprings:
-            assert get_max_tree_depth(offspring["genome"], 0, 0) \
-                   <= param["max_depth"]
+            offspring["fitness"] = DEFAULT_FITNESS
+            offspring["depth"] = get_max_tree_depth(offspring["genome"], 0, 0)
+            assert offspring["depth"] <= max_depth
 
     # Return the offsprings
     return offsprings
@@ -773,7 +1049,8 @@ def tournament_selection(population, param):
     Return individuals from a population by drawing
     `tournament_size` competitors randomly and selecting the best
     of the competitors. `population_size` number of tournaments are
-    held.
+    held. The competitors are drawn with replacement and all the
+    tournaments are held at once with NumPy.
 
     :param population: Population to select from
     :type population: list
@@ -783,18 +1060,19 @@ def tournament_selection(population, param):
     :rtype: list
     """
 
-    # Iterate until there are enough tournament winners selected
-    winners = []
-    while len(winners) < param["population_size"]:
-        # Randomly select tournament size individual solutions
-        # from the population.
-        competitors = random.sample(population, param["tournament_size"])
-        # Rank the selected solutions
-        competitors = sort_population(competitors)
-        # Append the best solution to the winners
-        winners.append(competitors[0])
+    # Get the fitness values
+    fitness_values = np.fromiter((ind["fitness"] for ind in population),
+                                 dtype=float, count=len(population))
+    # Randomly select tournament size individual solutions from the
+    # population for each tournament
+    competitors = param["rng"].generator.integers(
+        len(population),
+        size=(param["population_size"], param["tournament_size"]))
+    # Get the best solution of each tournament
+    best = np.argmax(fitness_values[competitors], axis=1)
+    winners = np.take_along_axis(competitors, best[:, np.newaxis], axis=1)
 
-    return winners
+    return [population[i] for i in winners[:, 0]]
 
 
 def generational_replacement(new_population, old_population, param):
@@ -815,10 +1093,11 @@ def generational_replacement(new_population, old_population, param):
 
     # Sort the population
     old_population = sort_population(old_population)
-    # Append a copy of the best solutions of the old population to
-    # the new population. ELITE_SIZE are taken
+    # Append the best solutions of the old population to the new
+    # population. ELITE_SIZE are taken. The variation operators copy a
+    # genome before changing it, so the elites are not copied
     for ind in old_population[:param["elite_size"]]:
-        new_population.append(copy.deepcopy(ind))
+        new_population.append(ind)
 
     # Sort the new population
     new_population = sort_population(new_population)
@@ -832,16 +1111,29 @@ def run(param):
     Return the best solution. Create an initial
     population. Perform an evolutionary search.
 
+    With more than one worker the fitness is evaluated in a pool of
+    processes, created once for the whole search.
+
     :param param: parameters for pony gp
     :type param: dict
     :returns: Best solution
     :rtype: dict
     """
 
-    # Create population
-    population = initialize_population(param)
-    # Start evolutionary search
-    best_ever = search_loop(population, param)
+    param["executor"] = None
+    if param["workers"] > 1:
+        param["executor"] = ProcessPoolExecutor(
+            param["workers"], initializer=initialize_worker,
+            initargs=(param["fitness_cases"], param["targets"]))
+
+    try:
+        # Create population
+        population = initialize_population(param)
+        # Start evolutionary search
+        best_ever = search_loop(population, param)
+    finally:
+        if param["executor"] is not None:
+            param["executor"].shutdown()
 
     return best_ever
 
@@ -855,8 +1147,8 @@ def parse_exemplars(file_name):
 
     :param file_name: CSV file with header
     :type file_name: str
-    :return: Fitness cases and targets
-    :rtype: list
+    :return: Fitness cases, a row per case, and targets
+    :rtype: tuple
     """
 
     # Open file
@@ -865,16 +1157,13 @@ def parse_exemplars(file_name):
         reader = csv.reader(in_file, delimiter=',')
 
         # Read the header
-        headers = reader.next()
+        headers = next(reader)
 
-        # Store fitness cases and their target values
-        fitness_cases = []
-        targets = []
-        for row in reader:
-            # Parse the columns to floats and append to fitness cases
-            fitness_cases.append(map(float, row[:-1]))
-            # The last column is the target
-            targets.append(float(row[-1]))
+        # Parse the rest of the file to floats at once
+        exemplars = np.loadtxt(in_file, delimiter=',', ndmin=2)
+        # The last column is the target
+        fitness_cases = exemplars[:, :-1]
+        targets = exemplars[:, -1]
 
         print("Reading: %s headers: %s exemplars:%d" %
               (file_name, headers, len(targets)))
@@ -928,7 +1217,7 @@ def get_symbols():
     return {"arities": arities, "terminals": terminals, "functions": functions}
 
 
-def get_test_and_train_data(fitness_cases_file, test_train_split):
+def get_test_and_train_data(fitness_cases_file, test_train_split, generator):
     """
     Return test and train data. Random selection from file containing data.
 
@@ -936,6 +1225,8 @@ def get_test_and_train_data(fitness_cases_file, test_train_split):
     :type fitness_cases_file: str
     :param test_train_split: Percentage of exemplar data used for training
     :type test_train_split: float
+    :param generator: Random number generator
+    :type generator: np.random.Generator
     :return: Test and train data. Both cases and targets
     :rtype: tuple
     """
@@ -943,26 +1234,18 @@ def get_test_and_train_data(fitness_cases_file, test_train_split):
     exemplars, targets = parse_exemplars(fitness_cases_file)
     split_idx = int(math.floor(len(exemplars) * test_train_split))
     # Randomize
-    idx = range(0, len(exemplars))
-    random.shuffle(idx)
-    training_cases = []
-    training_targets = []
-    test_cases = []
-    test_targets = []
-    for i in idx[:split_idx]:
-        training_cases.append(exemplars[i])
-        training_targets.append(targets[i])
-
-    for i in idx[split_idx:]:
-        test_cases.append(exemplars[i])
-        test_targets.append(targets[i])
+    idx = generator.permutation(len(exemplars))
+    training_idx = idx[:split_idx]
+    test_idx = idx[split_idx:]
 
+    # The cases are stored column by column, so the values of a variable
+    # are contiguous for the evaluation
     return ({
-        "fitness_cases": test_cases,
-        "targets": test_targets
+        "fitness_cases": np.asfortranarray(exemplars[test_idx]),
+        "targets": targets[test_idx]
     }, {
-        "fitness_cases": training_cases,
-        "targets": training_targets
+        "fitness_cases": np.asfortranarray(exemplars[training_idx]),
+        "targets": targets[training_idx]
     })
 
 
@@ -1053,6 +1336,28 @@ def parse_arguments():
         default=0.7,
         dest="test_train_split",
         help="test-train data split")
+    # Floating point type of the fitness cases and the evaluation
+    parser.add_option(
+        "--dtype",
+        type="choice",
+        choices=["float64", "float32"],
+        default="float64",
+        dest="dtype",
+        help="floating point type of the evaluation")
+    # Number of processes evaluating the fitness
+    parser.add_option(
+        "--workers",
+        type=int,
+        default=1,
+        dest="workers",
+        help="number of fitness evaluation processes")
+    # Log the details of the search, e.g. the initial trees
+    parser.add_option(
+        "--verbose",
+        action="store_true",
+        default=False,
+        dest="verbose",
+        help="log the settings and the initial trees")
     # Parse the command line arguments
     options, args = parser.parse_args()
     return options
@@ -1062,25 +1367,34 @@ def main():
     """Search. Evaluate best solution on out-of-sample data"""
 
     args = parse_arguments()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(message)s")
     # Set arguments
     seed = args.seed
     test_train_split = args.test_train_split
     fitness_cases_file = args.fitness_cases
+    # Random number generator for the split of the data and the search. 0
+    # is a seed as well
+    generator = np.random.default_rng(seed)
     # Get the exemplars
-    test, train = get_test_and_train_data(fitness_cases_file, test_train_split)
+    test, train = get_test_and_train_data(fitness_cases_file, test_train_split,
+                                          generator)
+    # The expressions are evaluated in the type of the exemplars
+    dtype = np.dtype(args.dtype)
+    for data in (test, train):
+        data["fitness_cases"] = data["fitness_cases"].astype(dtype, copy=False)
+        data["targets"] = data["targets"].astype(dtype, copy=False)
     # Get the symbols
     symbols = get_symbols()
 
-    # Print EA settings
-    print(args, symbols)
-
-    # Set random seed if not 0 is passed in as the seed
-    if seed != 0:
-        random.seed(seed)
+    # Log EA settings, only formatted with --verbose
+    LOGGER.debug("%s %s", args, symbols)
 
-    # Get the namespace dictionary
-    param = vars(args)
+    # Copy the namespace dictionary, so adding the parameters below does
+    # not change args
+    param = dict(vars(args))
     param["symbols"] = symbols
+    param["rng"] = RngPool(generator)
     param["fitness_cases"] = train["fitness_cases"]
     param["targets"] = train["targets"]
     best_ever = run(param)
@@ -1097,14 +1411,18 @@ def out_of_sample_test(individual, fitness_cases, targets, symbols):
     :param individual: Solution to test on data
     :type individual: dict
     :param fitness_cases: Input data used for testing
-    :type fitness_cases: list
+    :type fitness_cases: np.ndarray
     :param targets: Target values of data
-    :type targets: list
+    :type targets: np.ndarray
     :param symbols: Symbols
     :type symbols: dict
+    :return: Output of the solution for each test case
+    :rtype: np.ndarray
     """
-    evaluate_individual(individual, fitness_cases, targets, symbols)
+    individual["fitness"], outputs = evaluate_individual(
+        individual["genome"], fitness_cases, targets, symbols)
     print("Best solution on test data:" + str(individual))
+    return outputs
 
 
 if __name__ == '__main__':